@@ -1,8 +1,11 @@
-import subprocess
-import requests
-import json
+import asyncio
+import bisect
+import httpx
+import orjson
 from datetime import datetime, timedelta
 import os
+import pathlib
+import shutil
 import logging
 import time
 from telegram import Update
@@ -10,64 +13,143 @@ from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandl
 
 # Set up logging with AM/PM format
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'WARNING'),
     format='%(asctime)s - %(levelname)s - %(message)s',
     datefmt='%d-%m-%Y %I:%M:%S %p'
 )
 
 # Load the bot token from token.json (ensure this file is in the repository or handled securely)
-def load_token():
-    with open('token.json', 'r') as f:
-        data = json.load(f)
-    return data['token']
+TELEGRAM_API_TOKEN = orjson.loads(pathlib.Path('token.json').read_bytes())['token']
+
+# Cap concurrent subprocesses so overlapping segments and chats can't spawn
+# unbounded work: yt-dlp is network-bound so it may overlap more widely,
+# ffmpeg is CPU-bound so it is held to roughly the physical core count
+DOWNLOAD_SEM = asyncio.Semaphore(max(2, os.cpu_count() or 2))
+FFMPEG_SEM = asyncio.Semaphore(max(1, (os.cpu_count() or 2) // 2))
+
+class SegmentError(Exception):
+    """Raised inside the download/merge pipeline to abort a job with a user-facing message"""
+    pass
+
+# Keys rotate on 60-second windows; used as the probe granularity for
+# boundary detection and the cache bucket size for get_keys
+KEY_WINDOW = 60
+
+# Shared async client: HTTP/2 multiplexes concurrent key probes over a
+# single pooled TCP+TLS connection
+KEY_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+)
+
+# Successful key fetches keyed by (channel_id, start_bucket, end_bucket)
+KEY_CACHE = {}
+KEY_CACHE_MAX = 256
 
-TELEGRAM_API_TOKEN = load_token()
+async def get_keys_async(start_time, end_time, channel_id=114, max_attempts=3):
+    """Fetch decryption keys for a bucket-quantized window, served from cache when possible"""
+    start_bucket = int(start_time) // KEY_WINDOW
+    end_bucket = max(int(end_time) // KEY_WINDOW, start_bucket + 1)
+    cache_key = (channel_id, start_bucket, end_bucket)
+    if cache_key in KEY_CACHE:
+        return KEY_CACHE[cache_key]
 
-def get_keys(start_time, end_time, channel_id=114, max_attempts=3):
-    """Fetch decryption keys for the given time range"""
     for attempt in range(max_attempts):
         try:
-            start_time = str(int(start_time))
-            end_time = str(int(end_time))
-            url = f"https://chkey.jasssaini.xyz/get_keys?id={channel_id}&begin={start_time}&end={end_time}"
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            response = requests.get(url, headers=headers, timeout=10)
+            url = (f"https://chkey.jasssaini.xyz/get_keys"
+                   f"?id={channel_id}&begin={start_bucket * KEY_WINDOW}&end={end_bucket * KEY_WINDOW}")
+            response = await KEY_CLIENT.get(url)
             response.raise_for_status()
-            return response.json()["keys"]
+            keys = orjson.loads(response.content)["keys"]
+            if len(KEY_CACHE) >= KEY_CACHE_MAX:
+                KEY_CACHE.clear()
+            KEY_CACHE[cache_key] = keys
+            return keys
         except Exception as e:
-            logging.error(f"Failed to get keys (attempt {attempt + 1}): {e}")
+            logging.error("Failed to get keys (attempt %d): %s", attempt + 1, e)
             if attempt < max_attempts - 1:
-                time.sleep(2 ** attempt)
+                await asyncio.sleep(2 ** attempt)
+    return None
+
+async def get_keys_batch(channel_id, windows):
+    """Fetch keys for several (start, end) windows concurrently, preserving order"""
+    if not windows:
+        return []
+    return await asyncio.gather(*(get_keys_async(start, end, channel_id) for start, end in windows))
+
+async def find_key_boundaries(start_time, end_time, channel_id, probe_cache, granularity=KEY_WINDOW):
+    """Locate key-change boundaries in [start_time, end_time] by binary search
+
+    Probes both endpoints of each candidate range; if the keys match the
+    range is assumed stable, otherwise it is split at the midpoint and
+    both halves are searched, pinning each boundary down to `granularity`
+    seconds. Ranges are processed level by level so all probes a round
+    needs go out concurrently via get_keys_batch, and probe results are
+    memoized in probe_cache so shared endpoints are fetched once.
+    """
+    boundaries = []
+    pending = [(start_time, end_time)]
+    while pending:
+        unprobed = sorted({ts for time_range in pending for ts in time_range} - probe_cache.keys())
+        for ts, keys in zip(unprobed, await get_keys_batch(channel_id, [(ts, ts + KEY_WINDOW) for ts in unprobed])):
+            if not keys:
+                logging.error("Failed to get keys at %s", datetime.fromtimestamp(ts).strftime('%d-%m-%Y %I:%M %p'))
+            probe_cache[ts] = keys[0]["key"] if keys else None
+
+        next_pending = []
+        for range_start, range_end in pending:
+            start_key = probe_cache[range_start]
+            end_key = probe_cache[range_end]
+            if start_key is None or end_key is None or start_key == end_key:
+                continue
+            if range_end - range_start <= granularity:
+                if logging.getLogger().isEnabledFor(logging.INFO):
+                    logging.info("Key change detected at %s", datetime.fromtimestamp(range_end).strftime('%d-%m-%Y %I:%M %p'))
+                boundaries.append(range_end)
             else:
-                return None
-
-def detect_key_change_time(start_time, end_time, channel_id, interval=300):
-    """Detect when keys change by sampling at intervals"""
-    current_time = start_time
-    previous_key = None
-    key_changes = []
-    
-    while current_time < end_time:
-        keys = get_keys(current_time, current_time + 60, channel_id)
-        if not keys:
-            logging.error(f"Failed to get keys at {datetime.fromtimestamp(current_time).strftime('%d-%m-%Y %I:%M %p')}")
-            return key_changes
-        
-        current_key = keys[0]["key"] if keys else None
-        if previous_key and current_key != previous_key:
-            key_changes.append(current_time)
-            logging.info(f"Key change detected at {datetime.fromtimestamp(current_time).strftime('%d-%m-%Y %I:%M %p')}")
-        
-        previous_key = current_key
-        current_time += interval
-    
-    return key_changes
-
-def generate_time_segments(start_dt, end_dt, channel_id):
-    """Generate segments based on detected key changes"""
+                mid_time = (range_start + range_end) // 2
+                next_pending.append((range_start, mid_time))
+                next_pending.append((mid_time, range_end))
+        pending = next_pending
+    return boundaries
+
+async def detect_key_change_time(start_time, end_time, channel_id):
+    """Detect when keys change using binary search over the time range
+
+    Returns (key_changes, keyring) where keyring is the list of
+    (timestamp, key) pairs seen while probing, so callers can reuse
+    the keys instead of fetching them again per segment.
+    """
+    probe_cache = {}
+    key_changes = sorted(await find_key_boundaries(start_time, end_time, channel_id, probe_cache))
+    keyring = [(ts, key) for ts, key in sorted(probe_cache.items()) if key is not None]
+    return key_changes, keyring
+
+def lookup_key(keyring, timestamp):
+    """Return the key in effect at timestamp from a sampled (timestamp, key) keyring
+
+    Returns None when the keyring is empty or every sample lies after
+    timestamp — a later key says nothing about the segment, so callers
+    must fall back to fetching it directly.
+    """
+    if not keyring:
+        return None
+    timestamps = [ts for ts, _ in keyring]
+    index = bisect.bisect_right(timestamps, timestamp) - 1
+    if index < 0:
+        return None
+    return keyring[index][1]
+
+async def generate_time_segments(start_dt, end_dt, channel_id):
+    """Generate segments based on detected key changes
+
+    Returns (segments, keyring); the keyring carries the keys sampled
+    during detection for reuse by the download pipeline.
+    """
     start_ts = int(start_dt.timestamp())
     end_ts = int(end_dt.timestamp())
-    key_changes = detect_key_change_time(start_ts, end_ts, channel_id)
+    key_changes, keyring = await detect_key_change_time(start_ts, end_ts, channel_id)
     segments = []
     current_start = start_ts
     
@@ -87,11 +169,16 @@ def generate_time_segments(start_dt, end_dt, channel_id):
             segment_end = int(min(current_time + timedelta(minutes=15), end_dt).timestamp())
             segments.append((segment_start, segment_end))
             current_time += timedelta(minutes=15)
-    
-    return segments
 
-def download_segment(video_url, output_file, format_spec='bv', timeout=300):
-    """Download MPD segment using yt-dlp with original command"""
+    return segments, keyring
+
+async def download_av(video_url, output_template, timeout=300):
+    """Download best video and audio for a segment in one yt-dlp run
+
+    Uses '-f bv,ba' so the manifest is parsed and the connection
+    negotiated once for both streams; output_template must carry
+    %(ext)s so the two formats land in separate files.
+    """
     command = [
         'python', '-m', 'yt_dlp',
         '--geo-bypass-country', 'IN',
@@ -102,51 +189,75 @@ def download_segment(video_url, output_file, format_spec='bv', timeout=300):
         '--add-header', 'x-playback-session-id: b1222eddc62d6c9d',
         '--add-header', 'Referer: https://watch.tataplay.com/',
         '--add-header', 'Origin: https://watch.tataplay.com',
-        '-f', format_spec,
+        '-f', 'bv,ba',
         video_url,
-        '-o', output_file
+        '-o', output_template
     ]
     
-    try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=timeout)
-        logging.info(f"Successfully downloaded {output_file}")
-        return True
-    except subprocess.TimeoutExpired as e:
-        logging.error(f"Download timeout for {output_file}: {e.stdout}\n{e.stderr}")
-        return False
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Download failed for {output_file}: {e.stdout}\n{e.stderr}")
+    async with DOWNLOAD_SEM:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logging.error("Download timeout for %s", output_template)
+            return False
+
+    if process.returncode != 0:
+        logging.error("Download failed for %s: %s\n%s", output_template, stdout.decode(), stderr.decode())
         return False
-
-def decrypt_and_merge(video_file, audio_file, output_file, key):
-    """Decrypt and merge video and audio with stream synchronization"""
-    command = [
-        'ffmpeg',
-        '-decryption_key', key,
-        '-i', video_file,
-        '-decryption_key', key,
-        '-i', audio_file,
-        '-c:v', 'copy',
-        '-c:a', 'copy',
-        '-map', '0:v:0',
-        '-map', '1:a:0',
-        '-vsync', '2',
-        '-async', '1',
-        '-shortest',
-        '-fflags', '+genpts',
-        '-y',
-        output_file
-    ]
+    logging.info("Successfully downloaded %s", output_template)
+    return True
+
+async def probe_bitrate(media_file):
+    """Return the container bit rate of media_file in bits/s, or None if unknown"""
+    command = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', media_file]
+    async with FFMPEG_SEM:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        logging.error("ffprobe failed for %s", media_file)
+        return None
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=300)
-        logging.info(f"Successfully merged {output_file}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Merge failed for {output_file} (Chat ID: {update.message.chat_id}): {e.stderr}")
-        return False
-    except Exception as e:
-        logging.error(f"Merge failed: {e}")
-        return False
+        return int(orjson.loads(stdout)['format']['bit_rate'])
+    except (KeyError, ValueError):
+        return None
+
+def write_concat_list(list_path, files, keys):
+    """Write an ffmpeg concat demuxer list with a per-file decryption key
+
+    Uses the concat demuxer's `option` directive (ffmpeg >= 6.1) so each
+    encrypted input is decrypted in the same pass that concatenates it.
+    """
+    content = '\n'.join(
+        f"file '{os.path.abspath(file)}'\noption decryption_key {key}"
+        for file, key in zip(files, keys)
+    )
+    pathlib.Path(list_path).write_text(content + '\n')
+
+async def throttled_edit(bot, last_edit, chat_id, message_id, text, min_interval=2.0, final=False):
+    """Edit a status message at most once per min_interval seconds
+
+    Telegram flood-limits per-chat edits, and a blocked edit stalls the
+    whole job. last_edit is a single-element list holding the monotonic
+    timestamp of the previous edit so callers can share it between
+    coroutines; intermediate states inside the window are skipped,
+    terminal states (final=True) always go out.
+    """
+    now = time.monotonic()
+    if not final and now - last_edit[0] < min_interval:
+        return
+    last_edit[0] = now
+    await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode='HTML')
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -158,21 +269,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='HTML'
     )
 
-async def upload_progress(context, chat_id, message_id, file_size, uploaded_size):
-    """Update upload progress in Telegram"""
-    percent = min((uploaded_size / file_size) * 100, 100) if file_size > 0 else 0
-    await context.bot.edit_message_text(
-        chat_id=chat_id,
-        message_id=message_id,
-        text=(
-            "🚀 <b>Uploading Video</b> 🚀\n"
-            f"📏 <b>Size:</b> {file_size / (1024 * 1024):.2f} MB\n"
-            f"📈 <b>Progress:</b> {percent:.1f}%\n"
-            "⏳ <i>Uploading, please wait...</i>"
-        ),
-        parse_mode='HTML'
-    )
-
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text
     chat_id = update.message.chat_id
@@ -200,86 +296,159 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ <b>Start time must be before end time and duration must not exceed 6 hours!</b>", parse_mode='HTML')
         return
 
+    # strftime is costly (locale + libc); format the job boundaries once and
+    # reuse the strings in every progress edit, log line and filename
+    start_str_fmt = start_dt.strftime('%d-%m-%Y %I:%M %p')
+    end_str_fmt = end_dt.strftime('%d-%m-%Y %I:%M %p')
+    start_tag = start_dt.strftime('%d-%m-%Y_%I-%M_%p')
+    end_tag = end_dt.strftime('%d-%m-%Y_%I-%M_%p')
+
     processing_msg = await update.message.reply_text(
         "📡 <b>Processing MPD Download</b> 📡\n"
         "⏳ <i>Initializing...</i>\n"
-        f"⏰ <b>From:</b> {start_dt.strftime('%d-%m-%Y %I:%M %p')}\n"
-        f"⏰ <b>To:</b> {end_dt.strftime('%d-%m-%Y %I:%M %p')}\n"
+        f"⏰ <b>From:</b> {start_str_fmt}\n"
+        f"⏰ <b>To:</b> {end_str_fmt}\n"
         "✨ <b>Please wait...</b>",
         parse_mode='HTML'
     )
 
-    segments = generate_time_segments(start_dt, end_dt, channel_id)
+    segments, keyring = await generate_time_segments(start_dt, end_dt, channel_id)
     video_files = []
     audio_files = []
-    merged_files = []
+    segment_keys = []
+    completed = 0
+    last_edit = [0.0]
 
-    for i, (segment_start, segment_end) in enumerate(segments):
+    async def fetch_segment(i, segment_start, segment_end):
+        nonlocal completed
         start_time_str = datetime.fromtimestamp(segment_start).strftime('%d-%m-%Y_%I-%M_%p')
         end_time_str = datetime.fromtimestamp(segment_end).strftime('%d-%m-%Y_%I-%M_%p')
-        logging.info(f"Processing segment {i}: {start_time_str} to {end_time_str}")
+        logging.info("Processing segment %d: %s to %s", i, start_time_str, end_time_str)
+
+        key = lookup_key(keyring, segment_start)
+        if key is None:
+            keys = await get_keys_async(segment_start, segment_end, channel_id)
+            if not keys:
+                raise SegmentError(f"⚠️ Failed to fetch keys for segment {i} (Chat ID: {chat_id}).")
+            key = keys[0]["key"]
+        video_url = f"{base_url}?id={channel_id}&begin={segment_start}&end={segment_end}"
+
+        output_template = os.path.join(output_dir, f"segment_{i}_av_{start_time_str}.%(ext)s")
+        video_output = os.path.join(output_dir, f"segment_{i}_av_{start_time_str}.mp4")
+        audio_output = os.path.join(output_dir, f"segment_{i}_av_{start_time_str}.m4a")
+
+        if not await download_av(video_url, output_template):
+            raise SegmentError(f"⚠️ Failed to download segment {i} (Chat ID: {chat_id}).")
+        if not os.path.exists(video_output):
+            raise SegmentError(f"⚠️ Failed to download video for segment {i} (Chat ID: {chat_id}).")
+        if not os.path.exists(audio_output):
+            raise SegmentError(f"⚠️ Failed to download audio for segment {i} (Chat ID: {chat_id}).")
 
-        await context.bot.edit_message_text(
-            chat_id=processing_msg.chat_id,
-            message_id=processing_msg.message_id,
+        completed += 1
+        await throttled_edit(
+            context.bot, last_edit, processing_msg.chat_id, processing_msg.message_id,
             text=(
                 "📡 <b>Processing MPD Download</b> 📡\n"
-                f"⏳ <i>Segment {i + 1}/{len(segments)}...</i>\n"
-                f"⏰ <b>From:</b> {start_dt.strftime('%d-%m-%Y %I:%M %p')}\n"
-                f"⏰ <b>To:</b> {end_dt.strftime('%d-%m-%Y %I:%M %p')}\n"
+                f"⏳ <i>Segment {completed}/{len(segments)} downloaded...</i>\n"
+                f"⏰ <b>From:</b> {start_str_fmt}\n"
+                f"⏰ <b>To:</b> {end_str_fmt}\n"
                 "✨ <b>Downloading...</b>"
             ),
-            parse_mode='HTML'
+            final=completed == len(segments)
         )
+        return video_output, audio_output, key
 
-        keys = get_keys(segment_start, segment_end, channel_id)
-        if not keys:
-            await update.message.reply_text(f"⚠️ Failed to fetch keys for segment {i} (Chat ID: {chat_id}).")
-            return
+    if not segments:
+        await update.message.reply_text("❌ <b>No downloadable segments in the requested range!</b>", parse_mode='HTML')
+        return
 
-        key = keys[0]["key"]
-        video_url = f"{base_url}?id={channel_id}&begin={segment_start}&end={segment_end}"
+    # Fetch the first segment alone so its bitrate can be probed before
+    # committing to the rest of the range
+    try:
+        first_video, first_audio, first_key = await fetch_segment(0, *segments[0])
+    except SegmentError as e:
+        await update.message.reply_text(str(e))
+        return
+
+    # Project the final size from the first segment's bitrate and bail out
+    # now instead of discovering after hours of download and merge work
+    # that the file busts the 2 GB upload cap
+    video_rate, audio_rate = await asyncio.gather(
+        probe_bitrate(first_video), probe_bitrate(first_audio)
+    )
+    if video_rate:
+        projected_size = (video_rate + (audio_rate or 0)) / 8 * (end_dt - start_dt).total_seconds()
+        if projected_size > 2048 * 1024 * 1024:
+            await update.message.reply_text(
+                f"⚠️ Estimated size {projected_size / (1024 * 1024):.2f} MB exceeds the 2 GB upload limit. "
+                "Please request a shorter time range."
+            )
+            return
 
-        video_output = os.path.join(output_dir, f"segment_{i}_video_{start_time_str}.mp4")
-        audio_output = os.path.join(output_dir, f"segment_{i}_audio_{start_time_str}.m4a")
-        merged_output = os.path.join(output_dir, f"segment_{i}_merged_{start_time_str}.mkv")
+    video_files.append(first_video)
+    audio_files.append(first_audio)
+    segment_keys.append(first_key)
 
-        if download_segment(video_url, video_output, 'bv'):
+    # The semaphore inside download_av bounds how many yt-dlp processes
+    # actually run at once; gathering all segments keeps the pipe full
+    segment_tasks = [
+        asyncio.create_task(fetch_segment(i, segment_start, segment_end))
+        for i, (segment_start, segment_end) in enumerate(segments[1:], start=1)
+    ]
+    try:
+        for video_output, audio_output, key in await asyncio.gather(*segment_tasks):
             video_files.append(video_output)
-            if download_segment(video_url, audio_output, 'ba'):
-                audio_files.append(audio_output)
-                if decrypt_and_merge(video_output, audio_output, merged_output, key):
-                    merged_files.append(merged_output)
-                else:
-                    await update.message.reply_text(f"⚠️ Failed to merge segment {i} (Chat ID: {chat_id}).")
-                    return
-            else:
-                await update.message.reply_text(f"⚠️ Failed to download audio for segment {i} (Chat ID: {chat_id}).")
-                return
-        else:
-            await update.message.reply_text(f"⚠️ Failed to download video for segment {i} (Chat ID: {chat_id}).")
-            return
+            audio_files.append(audio_output)
+            segment_keys.append(key)
+    except SegmentError as e:
+        for task in segment_tasks:
+            task.cancel()
+        await asyncio.gather(*segment_tasks, return_exceptions=True)
+        await update.message.reply_text(str(e))
+        return
 
-    final_output = f"final_output_{channel_id}_{start_dt.strftime('%d-%m-%Y_%I-%M_%p')}_to_{end_dt.strftime('%d-%m-%Y_%I-%M_%p')}.mkv"
+    final_output = f"final_output_{channel_id}_{start_tag}_to_{end_tag}.mkv"
     final_path = os.path.abspath(os.path.join(output_dir, final_output))
-    os.chdir(output_dir)
-    with open('file_list.txt', 'w') as f:
-        for merged_file in merged_files:
-            f.write(f"file '{os.path.basename(merged_file)}'\n")
+    video_list = os.path.abspath(os.path.join(output_dir, 'video_list.txt'))
+    audio_list = os.path.abspath(os.path.join(output_dir, 'audio_list.txt'))
+
+    # Decrypt and concatenate every segment in one ffmpeg pass: each list
+    # entry carries its key via the concat demuxer's option directive, the
+    # only channel through which a decryption key reaches the child inputs
+    write_concat_list(video_list, video_files, segment_keys)
+    write_concat_list(audio_list, audio_files, segment_keys)
 
     final_command = [
-        'ffmpeg', '-f', 'concat', '-safe', '0', '-i', 'file_list.txt',
-        '-c:v', 'copy', '-c:a', 'copy', '-fflags', '+genpts', '-y', final_output
+        'ffmpeg', '-threads', '0',
+        '-f', 'concat', '-safe', '0', '-i', video_list,
+        '-f', 'concat', '-safe', '0', '-i', audio_list,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy', '-c:a', 'copy',
+        '-vsync', '2', '-async', '1', '-shortest',
+        '-avoid_negative_ts', 'make_zero',
+        '-fflags', '+genpts+fastseek', '-y', final_path
     ]
-    try:
-        subprocess.run(final_command, check=True, capture_output=True, text=True, timeout=1200)
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Concatenation failed: {e.stderr}")
-        await update.message.reply_text(f"⚠️ Failed to concatenate segments (Chat ID: {chat_id}).")
-        os.chdir(os.path.dirname(os.getcwd()))
+    async with FFMPEG_SEM:
+        process = await asyncio.create_subprocess_exec(
+            *final_command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=output_dir
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=1200)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logging.error("Decrypt/concatenation timed out")
+            await update.message.reply_text(f"⚠️ Failed to merge segments (Chat ID: {chat_id}).")
+            return
+
+    if process.returncode != 0:
+        logging.error("Decrypt/concatenation failed: %s", stderr.decode())
+        await update.message.reply_text(f"⚠️ Failed to merge segments (Chat ID: {chat_id}).")
         return
 
-    os.chdir(os.path.dirname(os.getcwd()))
     file_size = os.path.getsize(final_path)
     if file_size < 1024 * 1024 or file_size > 2048 * 1024 * 1024:
         await update.message.reply_text(f"⚠️ File size invalid: {file_size / (1024 * 1024):.2f} MB (Must be 1 MB to 2 GB)")
@@ -291,7 +460,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text=(
             "🚀 <b>Uploading Video</b> 🚀\n"
             f"📏 <b>Size:</b> {file_size / (1024 * 1024):.2f} MB\n"
-            "📈 <b>Progress:</b> 0.0%\n"
             "⏳ <i>Uploading, please wait...</i>"
         ),
         parse_mode='HTML'
@@ -316,44 +484,28 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     for attempt in range(max_retries):
         try:
-            async def upload_with_progress():
-                with open(final_path, 'rb') as video:
-                    uploaded = 0
-                    chunk_size = 50 * 1024 * 1024
-                    while True:
-                        chunk = video.read(chunk_size)
-                        if not chunk:
-                            break
-                        uploaded += len(chunk)
-                        if uploaded % (200 * 1024 * 1024) == 0 or uploaded == file_size:
-                            await upload_progress(context, chat_id, uploading_msg.message_id, file_size, uploaded)
-                    video.seek(0)
-                    await update.message.reply_video(
-                        video=video,
-                        caption=description,
-                        parse_mode='HTML',
-                        supports_streaming=True
-                    )
-
-            await upload_with_progress()
+            # Hand the library the path: PTB opens and streams the file with
+            # its own chunking instead of trips through a Python file wrapper
+            await update.message.reply_video(
+                video=pathlib.Path(final_path),
+                caption=description,
+                parse_mode='HTML',
+                supports_streaming=True
+            )
             await context.bot.delete_message(chat_id=chat_id, message_id=uploading_msg.message_id)
             break
 
         except Exception as e:
             if attempt < max_retries - 1:
-                logging.warning(f"Upload failed (Attempt {attempt + 1}/{max_retries}): {str(e)}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                logging.warning("Upload failed (Attempt %d/%d): %s. Retrying in %d seconds...", attempt + 1, max_retries, e, retry_delay)
+                await asyncio.sleep(retry_delay)
                 retry_delay *= 2
             else:
                 await update.message.reply_text(f"⚠️ Upload failed after {max_retries} attempts: {str(e)} (Chat ID: {chat_id})")
                 await context.bot.delete_message(chat_id=chat_id, message_id=uploading_msg.message_id)
                 return
 
-    for file in video_files + audio_files + merged_files + [final_path, os.path.join(output_dir, 'file_list.txt')]:
-        if os.path.exists(file):
-            os.remove(file)
-    if os.path.exists(output_dir):
-        os.rmdir(output_dir)
+    shutil.rmtree(output_dir, ignore_errors=True)
     logging.info("Cleanup completed successfully")
 
 def main():